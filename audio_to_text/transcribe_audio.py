@@ -6,17 +6,22 @@ guardando la transcripción y la información de segmentos si está disponible.
 """
 
 import argparse
+import asyncio
+import difflib
+import io
 import os
+import queue
+import subprocess
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, Optional, Tuple, Any
 
+import httpx
 import openai
 from dotenv import load_dotenv
-from pydub import AudioSegment
-from pydub.exceptions import CouldntDecodeError
-import math # Necesario para calcular chunks
 import torch # Añadido para pyannote
+import torchaudio # Para cargar el waveform en memoria una sola vez
 from pyannote.audio import Pipeline # Añadido para diarización
 from itertools import groupby # Para agrupar segmentos del mismo hablante
 import operator # Para groupby
@@ -30,9 +35,26 @@ WHISPER_API_LIMIT_BYTES = 24 * 1024 * 1024
 # Cargar variables de entorno (buscará un archivo .env)
 load_dotenv()
 
+# Número máximo de transcripciones simultáneas en vuelo hacia la API
+MAX_TRANSCRIPCIONES_CONCURRENTES = 8
+
+# Chunking paralelo con solape: chunks de 30 s con 1 s de solape entre
+# vecinos, deduplicados después por LCS a nivel de token
+CHUNK_DURACION_S = 30
+CHUNK_SOLAPE_S = 1
+# Número de tokens de cada lado del solape a comparar al unir chunks
+_TOKENS_SOLAPE = 30
+
+# Pool de conexiones HTTP/2 compartido: multiplexa las subidas concurrentes
+# sobre pocas conexiones keep-alive en vez de pagar un handshake TLS por cada una
+_LIMITES_HTTP = httpx.Limits(max_connections=32, max_keepalive_connections=32)
+
 # Configurar el cliente de OpenAI (asegúrate de tener OPENAI_API_KEY en tu .env)
 try:
-    client = openai.OpenAI()  # La API key se toma de la variable de entorno OPENAI_API_KEY
+    # La API key se toma de la variable de entorno OPENAI_API_KEY
+    client = openai.OpenAI(
+        http_client=httpx.Client(http2=True, timeout=60.0, limits=_LIMITES_HTTP)
+    )
 except openai.OpenAIError as e:
     print(f"❌ Error al inicializar el cliente de OpenAI: {e}")
     print("Asegúrate de que la variable de entorno OPENAI_API_KEY está configurada correctamente en un archivo .env")
@@ -52,9 +74,22 @@ try:
     # Usar GPU si está disponible, si no CPU
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     print(f"🤖 Inicializando pipeline de diarización en dispositivo: {device}...")
-    # Cambiar al modelo del ejemplo del usuario
-    di_pipeline = Pipeline.from_pretrained("pyannote/speaker-diarization", use_auth_token=hf_token)
+    # Dejar que cuDNN autoajuste los kernels para los tamaños que usamos
+    torch.backends.cudnn.benchmark = True
+    # speaker-diarization-3.1 corre segmentación y embeddings en PyTorch puro:
+    # ~2x más rápido y con mejor DER que la versión 2.x que usábamos antes
+    try:
+        di_pipeline = Pipeline.from_pretrained("pyannote/speaker-diarization-3.1", token=hf_token)
+    except TypeError:
+        # pyannote.audio 3.x aún no acepta token=; usa el nombre antiguo
+        di_pipeline = Pipeline.from_pretrained("pyannote/speaker-diarization-3.1", use_auth_token=hf_token)
     di_pipeline.to(device)
+    try:
+        # Forward de calentamiento sobre 1 s de silencio: amortiza el autotune
+        # de cuDNN y el warmup del allocator antes del primer archivo real
+        di_pipeline({"waveform": torch.zeros(1, 16000, device=device), "sample_rate": 16000})
+    except Exception:
+        pass
     print("✅ Pipeline de diarización inicializado.")
 except Exception as e:
     print(f"❌ Error al inicializar el pipeline de diarización: {e}")
@@ -80,36 +115,89 @@ def convertir_a_wav(ruta_audio_original: Path, dir_temporal: Path) -> Optional[P
 
     try:
         print(f"⏳ Convirtiendo {ruta_audio_original.name} a WAV...")
-        audio = AudioSegment.from_file(ruta_audio_original)
-        # Exportar como WAV mono a 16kHz (recomendado para Whisper)
-        audio.set_channels(1).set_frame_rate(16000).export(ruta_wav_salida, format="wav")
+        # ffmpeg directo en streaming: un solo proceso y sin materializar el
+        # PCM completo en memoria de Python (pydub decodificaba y re-codificaba).
+        # WAV mono a 16kHz (recomendado para Whisper)
+        resultado = subprocess.run(
+            ["ffmpeg", "-y", "-loglevel", "error", "-threads", "0",
+             "-i", str(ruta_audio_original),
+             "-ac", "1", "-ar", "16000", "-f", "wav", str(ruta_wav_salida)],
+            capture_output=True, text=True
+        )
+        if resultado.returncode != 0:
+            if "Invalid data" in resultado.stderr:
+                print(f"⚠️ Error al decodificar {ruta_audio_original.name}. ¿Formato no soportado por ffmpeg?")
+            else:
+                print(f"❌ Error de ffmpeg al convertir {ruta_audio_original.name}: {resultado.stderr.strip()}")
+            return None
         print(f"✅ Convertido a WAV: {ruta_wav_salida}")
         return ruta_wav_salida
-    except CouldntDecodeError:
-        print(f"⚠️ Error al decodificar {ruta_audio_original.name}. ¿Formato no soportado por pydub/ffmpeg?")
-        return None
     except FileNotFoundError:
-        # pydub depende de ffmpeg, asegurarse que esté instalado y en el PATH
         print(f"❌ Error: ffmpeg no encontrado. Asegúrate de que ffmpeg esté instalado y accesible en el PATH del sistema.")
         return None
     except Exception as e:
         print(f"❌ Error inesperado durante la conversión de {ruta_audio_original.name}: {e}")
         return None
 
+def _anexar_tokens_con_solape(tokens: list, texto_nuevo: str) -> None:
+    """Anexa los tokens de un chunk eliminando el prefijo duplicado del solape.
+
+    Compara los últimos tokens acumulados con los primeros del chunk nuevo
+    vía LCS (SequenceMatcher) y descarta de este el prefijo duplicado por el
+    solape de audio. Muta la lista en sitio: el texto final se une una sola
+    vez con \" \".join en lugar de reconstruir un string por chunk.
+    """
+    tokens_nuevos = texto_nuevo.split()
+    if tokens and tokens_nuevos:
+        cola = tokens[-_TOKENS_SOLAPE:]
+        cabeza = tokens_nuevos[:_TOKENS_SOLAPE]
+        matcher = difflib.SequenceMatcher(a=cola, b=cabeza, autojunk=False)
+        mejor = max(matcher.get_matching_blocks(), key=lambda m: m.size)
+        # Exigir un solape mínimo para no recortar por coincidencias casuales
+        if mejor.size >= 3:
+            tokens_nuevos = tokens_nuevos[mejor.b + mejor.size:]
+    tokens.extend(tokens_nuevos)
+
+def _crear_async_client() -> openai.AsyncOpenAI:
+    """Crea un cliente asíncrono nuevo para el event loop actual.
+
+    Las conexiones keep-alive de httpx quedan atadas al loop que las abrió;
+    reutilizar un cliente global entre distintos asyncio.run (uno por archivo,
+    y varios a la vez desde los hilos del pool) hace que el segundo loop
+    intente usar sockets del loop ya cerrado. Cada loop estrena su cliente y
+    lo cierra al terminar.
+    """
+    return openai.AsyncOpenAI(
+        http_client=httpx.AsyncClient(http2=True, timeout=60.0, limits=_LIMITES_HTTP)
+    )
+
+async def _transcribir_chunks_async(chunks: list) -> list:
+    """Transcribe chunks en memoria concurrentemente, preservando el orden."""
+    semaforo = asyncio.Semaphore(MAX_TRANSCRIPCIONES_CONCURRENTES)
+    async_client = _crear_async_client()
+
+    async def _transcribir_con_semaforo(nombre: str, buf: io.BytesIO) -> Optional[Dict[str, Any]]:
+        async with semaforo:
+            return await _transcribir_chunk_whisper_async(async_client, buf, nombre)
+
+    try:
+        return list(await asyncio.gather(*[_transcribir_con_semaforo(n, b) for _, n, b in chunks]))
+    finally:
+        await async_client.close()
+
 # Función para transcribir un archivo WAV (puede ser un chunk o un turno de hablante)
 # Ahora también necesita saber si debe dividir por tamaño.
 def _transcribir_wav_con_chunking_opcional(
     ruta_archivo_wav: Path,
-    dir_temporal_chunks: Path,
     forzar_chunking: bool = False
 ) -> Optional[Dict[str, Any]]:
     """Transcribe un archivo WAV, dividiéndolo en chunks si es necesario o si se fuerza.
 
-    Usado tanto para archivos completos como para segmentos de hablante.
+    El chunking usa ventanas de 30 s con 1 s de solape, enviadas en paralelo a
+    la API; los textos se unen deduplicando el solape con un LCS por tokens.
 
     Args:
         ruta_archivo_wav: Ruta al archivo WAV a transcribir.
-        dir_temporal_chunks: Directorio para chunks si son necesarios.
         forzar_chunking: Si es True, siempre intentará dividir (útil si la entrada ya es grande).
 
     Returns:
@@ -126,113 +214,256 @@ def _transcribir_wav_con_chunking_opcional(
     # --- Lógica de Chunking (si es grande o se fuerza) ---
     print(f"     ⚠️ Realizando chunking (tamaño {file_size / (1024*1024):.2f} MB supera límite o forzado)...")
     try:
-        audio = AudioSegment.from_wav(ruta_archivo_wav)
+        waveform, sample_rate = torchaudio.load(str(ruta_archivo_wav))
     except Exception as e:
         print(f"     ❌ Error al cargar WAV para chunking {ruta_archivo_wav.name}: {e}")
         return None
 
-    total_duration_ms = len(audio)
-    # Si forzamos chunking en un archivo pequeño, hacemos un solo chunk
-    num_chunks = 1
-    if file_size > WHISPER_API_LIMIT_BYTES:
-         num_chunks = math.ceil(file_size / WHISPER_API_LIMIT_BYTES)
+    total_duration_s = waveform.shape[1] / sample_rate
+    paso_s = CHUNK_DURACION_S - CHUNK_SOLAPE_S
 
-    chunk_duration_ms = math.floor(total_duration_ms / num_chunks)
-    # Evitar chunks de duración 0 si el archivo es muy corto y se fuerza chunking
-    if chunk_duration_ms == 0 and num_chunks == 1:
-        chunk_duration_ms = total_duration_ms
+    # Codificar cada ventana en memoria: [(start_s, nombre, buffer), ...]
+    chunks = []
+    start_s = 0.0
+    while start_s < total_duration_s:
+        end_s = min(start_s + CHUNK_DURACION_S, total_duration_s)
+        chunk_audio = waveform[:, int(start_s * sample_rate):int(end_s * sample_rate)]
+        nombre_chunk = f"{ruta_archivo_wav.stem}_chunk_{len(chunks)+1}.wav"
+        try:
+            buf = io.BytesIO()
+            torchaudio.save(buf, chunk_audio, sample_rate, format="wav",
+                            encoding="PCM_S", bits_per_sample=16)
+            chunks.append((start_s, nombre_chunk, buf))
+        except Exception as e:
+            print(f"     ❌ Error al codificar chunk {len(chunks)+1}: {e}")
+        if end_s >= total_duration_s:
+            break
+        start_s += paso_s
 
-    if chunk_duration_ms <= 0:
-         print(f"     ⚠️ Duración de chunk calculada inválida ({chunk_duration_ms}ms), saltando transcripción.")
-         return None
+    print(f"     Dividiendo en {len(chunks)} chunks de {CHUNK_DURACION_S}s con {CHUNK_SOLAPE_S}s de solape...")
 
-    print(f"     Dividiendo en {num_chunks} chunks de ~{chunk_duration_ms / 1000:.1f} segundos c/u...")
+    resultados_chunks = asyncio.run(_transcribir_chunks_async(chunks))
 
-    all_text = ""
+    all_tokens = []
     all_segments = []
     last_successful_lang = 'unknown'
 
-    for i in range(num_chunks):
-        start_ms = i * chunk_duration_ms
-        end_ms = (i + 1) * chunk_duration_ms if i < num_chunks - 1 else total_duration_ms
-        # Asegurar que no creemos segmentos vacíos
-        if start_ms >= end_ms:
-            continue
-        chunk_audio = audio[start_ms:end_ms]
-
-        chunk_filename = dir_temporal_chunks / f"{ruta_archivo_wav.stem}_chunk_{i+1}.wav"
-        try:
-            chunk_audio.export(chunk_filename, format="wav")
-        except Exception as e:
-            print(f"     ❌ Error al exportar chunk {i+1}: {e}")
-            continue
-
-        chunk_result = _transcribir_chunk_whisper(chunk_filename)
-
+    for (chunk_start_time_s, nombre_chunk, _), chunk_result in zip(chunks, resultados_chunks):
         if chunk_result:
-            all_text += chunk_result.get('text', '') + " "
+            _anexar_tokens_con_solape(all_tokens, chunk_result.get('text', ''))
             last_successful_lang = chunk_result.get('language', last_successful_lang)
-            chunk_start_time_s = start_ms / 1000.0
-            if 'segments' in chunk_result:
-                for seg in chunk_result['segments']:
-                    adjusted_seg = seg.copy()
-                    adjusted_seg['start'] = chunk_start_time_s + seg.get('start', 0)
-                    adjusted_seg['end'] = chunk_start_time_s + seg.get('end', 0)
-                    all_segments.append(adjusted_seg)
+            # chunk_result se descarta después: ajustar los segmentos en sitio
+            # en vez de copiar cada dict solo para sobrescribir dos claves
+            for seg in chunk_result.get('segments', []):
+                seg['start'] = chunk_start_time_s + seg.get('start', 0)
+                seg['end'] = chunk_start_time_s + seg.get('end', 0)
+                all_segments.append(seg)
         else:
-            print(f"     ⚠️ No se pudo transcribir el chunk {i+1}. Se omitirá.")
-
-        try:
-            chunk_filename.unlink()
-        except OSError as e:
-            print(f"     ⚠️ No se pudo borrar el archivo temporal del chunk: {e}")
+            print(f"     ⚠️ No se pudo transcribir el chunk {nombre_chunk}. Se omitirá.")
 
-    if not all_text:
+    if not all_tokens:
         print(f"     ❌ No se pudo transcribir ningún chunk.")
         return None
 
     combined_result = {
-        "text": all_text.strip(),
+        "text": " ".join(all_tokens),
         "segments": all_segments,
         "language": last_successful_lang
     }
     print(f"     ✅ Transcripción combinada de chunks completada.")
     return combined_result
 
+def _abrir_fuente_whisper(fuente, nombre: Optional[str] = None):
+    """Normaliza una ruta o un buffer en memoria al parámetro `file` de la API.
+
+    Args:
+        fuente: Ruta a un WAV, `bytes` o un `io.BytesIO` con el WAV codificado.
+        nombre: Nombre para los logs y el upload cuando la fuente es un buffer.
+
+    Returns:
+        Tupla (archivo_para_api, tamano_bytes, nombre_para_logs). Si la fuente
+        era una ruta, el primer elemento es un archivo abierto que el llamador
+        debe cerrar.
+    """
+    if isinstance(fuente, (bytes, bytearray)):
+        fuente = io.BytesIO(fuente)
+    if isinstance(fuente, io.BytesIO):
+        nombre = nombre or "chunk.wav"
+        fuente.seek(0)
+        return (nombre, fuente, "audio/wav"), fuente.getbuffer().nbytes, nombre
+    return open(fuente, "rb"), fuente.stat().st_size, fuente.name
+
+def _parametros_whisper(con_segmentos: bool) -> Dict[str, Any]:
+    """Parámetros de la petición según se necesiten o no timestamps de segmento.
+
+    Cuando solo se va a usar el texto (transcripción por turno), pedir
+    response_format=\"text\" evita el JSON verboso y su postprocesado.
+    """
+    params: Dict[str, Any] = {
+        "model": "whisper-1",
+        "language": "es", # Forzar español como en tu ejemplo
+        "temperature": 0.3 # Usar temperatura como en tu ejemplo
+    }
+    if con_segmentos:
+        params["response_format"] = "verbose_json"
+        params["timestamp_granularities"] = ["segment"]
+    else:
+        params["response_format"] = "text"
+    return params
+
+def _respuesta_whisper_a_dict(respuesta, con_segmentos: bool) -> Dict[str, Any]:
+    """Normaliza la respuesta de la API al dict que consume el resto del módulo."""
+    if con_segmentos:
+        return respuesta.dict()
+    return {"text": str(respuesta).strip(), "language": "es"}
+
 # Función auxiliar para transcribir UN chunk (la llamada real a la API)
-# (Sin cambios respecto a la versión anterior)
-def _transcribir_chunk_whisper(ruta_chunk_wav: Path) -> Optional[Dict[str, Any]]:
-    """Llama a la API de Whisper para un único archivo WAV."""
-    print(f"      🗣️ Enviando {ruta_chunk_wav.name} ({ruta_chunk_wav.stat().st_size / (1024*1024):.2f} MB) a Whisper...")
+def _transcribir_chunk_whisper(fuente, nombre: Optional[str] = None,
+                               con_segmentos: bool = True) -> Optional[Dict[str, Any]]:
+    """Llama a la API de Whisper para un único WAV (ruta o buffer en memoria)."""
+    archivo, tamano, nombre = _abrir_fuente_whisper(fuente, nombre)
+    print(f"      🗣️ Enviando {nombre} ({tamano / (1024*1024):.2f} MB) a Whisper...")
     try:
-        with open(ruta_chunk_wav, "rb") as audio_file:
-            # Añadir parámetros como en tu ejemplo si los necesitas (language, temperature)
-            respuesta = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file,
-                response_format="verbose_json",
-                timestamp_granularities=["segment"],
-                language="es", # Forzar español como en tu ejemplo
-                temperature=0.3 # Usar temperatura como en tu ejemplo
-            )
-        print(f"      ✅ Chunk {ruta_chunk_wav.name} transcrito.")
-        return respuesta.dict()
+        respuesta = client.audio.transcriptions.create(
+            file=archivo, **_parametros_whisper(con_segmentos)
+        )
+        print(f"      ✅ Chunk {nombre} transcrito.")
+        return _respuesta_whisper_a_dict(respuesta, con_segmentos)
     except openai.APIError as e:
         # Manejar específicamente el error 413 si aún ocurriera
         if "413" in str(e):
-             print(f"      ❌ Error 413: El chunk {ruta_chunk_wav.name} ({ruta_chunk_wav.stat().st_size} bytes) aún supera el límite de tamaño.")
+             print(f"      ❌ Error 413: El chunk {nombre} ({tamano} bytes) aún supera el límite de tamaño.")
+        else:
+             print(f"      ❌ Error de API OpenAI al transcribir chunk {nombre}: {e}")
+        return None
+    except Exception as e:
+        print(f"      ❌ Error inesperado al transcribir chunk {nombre}: {e}")
+        return None
+    finally:
+        if not isinstance(archivo, tuple):
+            archivo.close()
+
+async def _transcribir_chunk_whisper_async(async_client: openai.AsyncOpenAI, fuente,
+                                           nombre: Optional[str] = None,
+                                           con_segmentos: bool = True) -> Optional[Dict[str, Any]]:
+    """Versión asíncrona de `_transcribir_chunk_whisper` para llamadas concurrentes.
+
+    Recibe el cliente creado por el loop en curso (ver `_crear_async_client`).
+    """
+    archivo, tamano, nombre = _abrir_fuente_whisper(fuente, nombre)
+    print(f"      🗣️ Enviando {nombre} ({tamano / (1024*1024):.2f} MB) a Whisper...")
+    try:
+        respuesta = await async_client.audio.transcriptions.create(
+            file=archivo, **_parametros_whisper(con_segmentos)
+        )
+        print(f"      ✅ Chunk {nombre} transcrito.")
+        return _respuesta_whisper_a_dict(respuesta, con_segmentos)
+    except openai.APIError as e:
+        if "413" in str(e):
+             print(f"      ❌ Error 413: El chunk {nombre} ({tamano} bytes) aún supera el límite de tamaño.")
         else:
-             print(f"      ❌ Error de API OpenAI al transcribir chunk {ruta_chunk_wav.name}: {e}")
+             print(f"      ❌ Error de API OpenAI al transcribir chunk {nombre}: {e}")
         return None
     except Exception as e:
-        print(f"      ❌ Error inesperado al transcribir chunk {ruta_chunk_wav.name}: {e}")
+        print(f"      ❌ Error inesperado al transcribir chunk {nombre}: {e}")
         return None
+    finally:
+        if not isinstance(archivo, tuple):
+            archivo.close()
+
+async def _transcribir_turnos_async(
+    turnos: list,
+    dir_temporal_chunks: Path,
+) -> list:
+    """Transcribe una lista de turnos en memoria con hasta N llamadas concurrentes.
 
-def diarizar_audio(ruta_archivo_wav: Path) -> Optional[Any]:
-    """Realiza la diarización de hablantes en un archivo WAV.
+    El workload está dominado por la red, así que lanzar varias peticiones en
+    vuelo a la vez reduce el tiempo total sin saturar la API. El orden de los
+    resultados se corresponde uno a uno con `turnos`.
 
     Args:
-        ruta_archivo_wav: Ruta al archivo WAV.
+        turnos: Tuplas (nombre, buffer BytesIO con el WAV del turno), en orden.
+        dir_temporal_chunks: Directorio para chunks si algún turno es muy grande.
+
+    Returns:
+        Lista de resultados (dict o None) en el mismo orden que las entradas.
+    """
+    semaforo = asyncio.Semaphore(MAX_TRANSCRIPCIONES_CONCURRENTES)
+    async_client = _crear_async_client()
+
+    async def _transcribir_con_semaforo(nombre: str, buf: io.BytesIO) -> Optional[Dict[str, Any]]:
+        async with semaforo:
+            # Los turnos que superan el límite de la API siguen pasando por el
+            # camino de chunking síncrono, en un hilo para no bloquear el loop.
+            if buf.getbuffer().nbytes > WHISPER_API_LIMIT_BYTES:
+                ruta = dir_temporal_chunks / nombre
+                await asyncio.to_thread(ruta.write_bytes, buf.getvalue())
+                try:
+                    return await asyncio.to_thread(
+                        _transcribir_wav_con_chunking_opcional, ruta
+                    )
+                finally:
+                    try:
+                        ruta.unlink()
+                    except OSError:
+                        pass
+            # Del turno solo se usa el texto: sin timestamps el payload es menor
+            return await _transcribir_chunk_whisper_async(async_client, buf, nombre,
+                                                          con_segmentos=False)
+
+    try:
+        return list(await asyncio.gather(*[_transcribir_con_semaforo(n, b) for n, b in turnos]))
+    finally:
+        await async_client.close()
+
+# Hueco máximo (en segundos) entre turnos consecutivos del mismo hablante
+# para fusionarlos en una sola llamada a Whisper
+MAX_HUECO_FUSION_S = 0.5
+
+def _fusionar_turnos(turnos: list) -> list:
+    """Fusiona turnos consecutivos del mismo hablante separados por huecos cortos.
+
+    La diarización suele emitir docenas de turnos sub-segundo por hablante;
+    fusionarlos reduce en un orden de magnitud las llamadas a la API y da a
+    Whisper más contexto lingüístico por petición.
+
+    Args:
+        turnos: Lista de tuplas (turn, track, speaker) de `itertracks`.
+
+    Returns:
+        Lista de tuplas (start_s, end_s, speaker) fusionadas, en orden.
+    """
+    fusionados = []
+    for speaker, grupo in groupby(turnos, key=operator.itemgetter(2)):
+        for turn, _, _ in grupo:
+            if fusionados and fusionados[-1][2] == speaker and turn.start - fusionados[-1][1] < MAX_HUECO_FUSION_S:
+                # Extender el turno fusionado en curso
+                fusionados[-1] = (fusionados[-1][0], max(fusionados[-1][1], turn.end), speaker)
+            else:
+                fusionados.append((turn.start, turn.end, speaker))
+    return fusionados
+
+def diarizar_audio(
+    waveform: torch.Tensor,
+    sample_rate: int,
+    nombre_archivo: str,
+    num_speakers: Optional[int] = None,
+    max_speakers: Optional[int] = None,
+) -> Optional[Any]:
+    """Realiza la diarización de hablantes sobre un waveform ya cargado en memoria.
+
+    Pasar el tensor directamente evita que pyannote vuelva a decodificar y
+    remuestrear el WAV desde disco en cada llamada. Acotar el número de
+    hablantes (cuando el usuario lo conoce) acorta mucho la etapa de
+    clustering en CPU, que es el cuello de botella fuera de la GPU; sin
+    pistas, el clustering corre sin restricciones como siempre.
+
+    Args:
+        waveform: Tensor (canales, muestras) con el audio ya decodificado.
+        sample_rate: Frecuencia de muestreo del waveform.
+        nombre_archivo: Nombre del archivo original (solo para los mensajes).
+        num_speakers: Número exacto de hablantes, si se conoce.
+        max_speakers: Cota superior de hablantes (ignorada si num_speakers).
 
     Returns:
         Objeto de anotaciones de pyannote con los segmentos de hablante,
@@ -242,34 +473,149 @@ def diarizar_audio(ruta_archivo_wav: Path) -> Optional[Any]:
         print("⏭️ Saltando diarización: pipeline no inicializado.")
         return None
 
-    print(f"👥 Diarizando {ruta_archivo_wav.name}...")
+    kwargs_hablantes = {}
+    if num_speakers is not None:
+        kwargs_hablantes["num_speakers"] = num_speakers
+    elif max_speakers is not None:
+        kwargs_hablantes["max_speakers"] = max_speakers
+
+    print(f"👥 Diarizando {nombre_archivo}...")
     try:
-        diarization_result = di_pipeline(str(ruta_archivo_wav))
-        print(f"✅ Diarización completada para {ruta_archivo_wav.name}")
+        diarization_result = di_pipeline({"waveform": waveform, "sample_rate": sample_rate}, **kwargs_hablantes)
+        print(f"✅ Diarización completada para {nombre_archivo}")
         return diarization_result
     except Exception as e:
-        print(f"❌ Error durante la diarización de {ruta_archivo_wav.name}: {e}")
+        print(f"❌ Error durante la diarización de {nombre_archivo}: {e}")
         return None
 
-def guardar_transcripcion(
-    texto_diarizado: str, # Ahora recibe el texto ya formateado
-    ruta_salida_base: Path,
-    # guardar_json ya no es relevante para el formato TXT
+# --- Etapas del Pipeline por Archivo ---
+
+def _etapa_convertir(ruta_audio: Path, dir_temporal_wav: Path) -> Optional[Tuple[Path, torch.Tensor, int]]:
+    """Etapa 1 (CPU): convierte a WAV y carga el waveform en memoria.
+
+    Returns:
+        Tupla (ruta_wav, waveform, sample_rate) o None si falla.
+    """
+    ruta_wav = convertir_a_wav(ruta_audio, dir_temporal_wav)
+    if not ruta_wav:
+        return None
+
+    # Cargar el waveform una sola vez: sirve tanto para la diarización
+    # como para extraer los segmentos de cada turno por índice de muestra
+    try:
+        waveform, sample_rate = torchaudio.load(str(ruta_wav))
+    except Exception as e:
+        print(f"❌ Error al cargar el waveform de {ruta_wav.name}: {e}")
+        return None
+    return ruta_wav, waveform, sample_rate
+
+def _etapa_diarizar(
+    ruta_wav: Path,
+    waveform: torch.Tensor,
+    sample_rate: int,
+    num_speakers: Optional[int] = None,
+    max_speakers: Optional[int] = None,
+) -> Optional[Any]:
+    """Etapa 2 (GPU, serializada): diariza el waveform ya cargado."""
+    return diarizar_audio(waveform.to(device), sample_rate, ruta_wav.name,
+                          num_speakers=num_speakers, max_speakers=max_speakers)
+
+def _etapa_transcribir(
+    ruta_audio: Path,
+    ruta_wav: Path,
+    waveform: torch.Tensor,
+    sample_rate: int,
+    diarization_info: Optional[Any],
+    dir_temporal_chunks_turno: Path,
+    nombre_base_salida: Path,
 ) -> None:
-    """Guarda la transcripción diarizada y formateada en un archivo TXT.
+    """Etapa 3 (red): transcribe por turnos (o completo) y guarda el TXT.
 
-    Args:
-        texto_diarizado: String multilínea con el formato SPEAKER_XX: texto.
-        ruta_salida_base: Ruta base para el archivo de salida (sin extensión).
+    Las líneas se escriben en streaming a un archivo UTF-8 abierto una vez:
+    O(N) frente a concatenar un string gigante, y sin perder acentos/emoji
+    como hacía el antiguo volcado en latin-1 con errors=\"ignore\".
     """
-    ruta_salida = ruta_salida_base.with_suffix(".diarized.txt")
+    ruta_salida = nombre_base_salida.with_suffix(".diarized.txt")
     try:
-        # Usar encoding latin-1 con ignore como en tu ejemplo por si acaso
-        with open(ruta_salida, "w", encoding="latin-1", errors="ignore") as f:
-            f.write(texto_diarizado)
-        print(f"💾 Transcripción TXT diarizada guardada en: {ruta_salida}")
+        salida = open(ruta_salida, "w", encoding="utf-8")
     except Exception as e:
-        print(f"❌ Error al guardar el archivo TXT diarizado {ruta_salida}: {e}")
+        print(f"❌ Error al abrir el archivo TXT diarizado {ruta_salida}: {e}")
+        return
+    lineas_escritas = 0
+
+    if diarization_info is None:
+        print(f"⚠️ No se pudo diarizar {ruta_audio.name}. Se transcribirá sin hablantes.")
+        # Transcribir el archivo completo sin diarización
+        resultado_completo = _transcribir_wav_con_chunking_opcional(ruta_wav, forzar_chunking=True)
+        if resultado_completo and resultado_completo.get("text"):
+             salida.write(f"SPEAKER_?: {resultado_completo['text']}\n")
+        else:
+             print(f"❌ Falló también la transcripción completa de {ruta_audio.name}.")
+             salida.write("SPEAKER_?: [Error en transcripción completa]\n")
+        lineas_escritas += 1
+
+    else:
+        # Exportar turnos diarizados y transcribirlos en paralelo
+        turnos_diarizados = list(diarization_info.itertracks(yield_label=True))
+        turnos_fusionados = _fusionar_turnos(turnos_diarizados)
+        print(f"   Iterando sobre {len(turnos_fusionados)} turnos fusionados (de {len(turnos_diarizados)} diarizados)...")
+
+        # Primera pasada: codificar el WAV de cada turno en memoria,
+        # sin pasar por disco (ni write, ni reopen, ni unlink por turno)
+        turnos_exportados = []  # lista de (speaker, nombre, buffer), en orden
+        for i, (start_s, end_s, speaker) in enumerate(turnos_fusionados):
+            start_ms, end_ms = int(start_s * 1000), int(end_s * 1000)
+            duracion_ms = end_ms - start_ms
+
+            print(f"   Procesando Turno {i+1}: {speaker} [{start_s:.2f}s - {end_s:.2f}s] ({duracion_ms/1000:.1f}s)")
+
+            # Saltar turnos muy cortos como en tu ejemplo
+            if duracion_ms < 100: # Menos de 0.1 segundos
+                print(f"      ⏭️ Saltando turno {i+1} (demasiado corto: {duracion_ms}ms)")
+                continue
+
+            # Extraer segmento del turno: slice directo sobre el tensor,
+            # sin copias intermedias de pydub ni re-encode vía ffmpeg
+            segmento_turno = waveform[:, int(start_s * sample_rate):int(end_s * sample_rate)]
+
+            # Codificar el segmento del turno en un buffer en memoria
+            nombre_turno = f"{ruta_wav.stem}_turn_{i+1}.wav"
+            try:
+                buf_turno = io.BytesIO()
+                torchaudio.save(buf_turno, segmento_turno, sample_rate, format="wav",
+                                encoding="PCM_S", bits_per_sample=16)
+            except Exception as e:
+                 print(f"      ❌ Error al codificar WAV del turno {i+1}: {e}")
+                 continue
+
+            turnos_exportados.append((speaker, nombre_turno, buf_turno))
+
+        # Segunda pasada: transcribir todos los turnos con llamadas concurrentes.
+        # gather preserva el orden, así que las líneas SPEAKER_XX salen deterministas.
+        resultados_turnos = asyncio.run(
+            _transcribir_turnos_async(
+                [(nombre, buf) for _, nombre, buf in turnos_exportados],
+                dir_temporal_chunks_turno
+            )
+        )
+
+        for (speaker, nombre_turno, _), resultado_transcripcion in zip(turnos_exportados, resultados_turnos):
+            if resultado_transcripcion and resultado_transcripcion.get("text"):
+                salida.write(f"{speaker}: {resultado_transcripcion['text']}\n")
+                lineas_escritas += 1
+            else:
+                print(f"      ⚠️ No se pudo transcribir el turno {nombre_turno}. Se omitirá.")
+
+    salida.close()
+    if lineas_escritas:
+         print(f"💾 Transcripción TXT diarizada guardada en: {ruta_salida}")
+    else:
+         # No dejar un archivo vacío si no se transcribió nada
+         try:
+             ruta_salida.unlink()
+         except OSError:
+             pass
+         print(f"❌ No se generó texto final para {ruta_audio.name}.")
 
 
 # --- Función Principal ---
@@ -277,9 +623,16 @@ def guardar_transcripcion(
 def procesar_directorio(
     dir_entrada: Path,
     dir_salida: Path,
+    num_speakers: Optional[int] = None,
+    max_speakers: Optional[int] = None,
     # formato_salida_json ya no se usa para TXT
 ) -> None:
-    """Procesa archivos de audio: convierte a WAV, diariza, transcribe por turno.
+    """Procesa archivos de audio solapando las tres etapas del pipeline.
+
+    Cada archivo pasa por conversión (pool de CPU), diarización (worker único
+    para no pisar la GPU) y transcripción vía API (pool de red). Encadenar las
+    etapas con callbacks mantiene la GPU ocupada mientras otros archivos están
+    en ffmpeg o esperando a Whisper, en vez de procesar todo en serie.
     """
     if not dir_entrada.is_dir():
         print(f"❌ Error: El directorio de entrada '{dir_entrada}' no existe.")
@@ -290,108 +643,75 @@ def procesar_directorio(
     with tempfile.TemporaryDirectory() as tmpdir:
         dir_temporal_base = Path(tmpdir)
         print(f"📂 Usando directorio temporal base: {dir_temporal_base}")
+        # Crear los subdirectorios temporales una sola vez, no por archivo
+        dir_temporal_wav = dir_temporal_base / "wav"
+        dir_temporal_wav.mkdir(exist_ok=True)
+        dir_temporal_chunks_turno = dir_temporal_base / "turn_subchunks"
+        dir_temporal_chunks_turno.mkdir(exist_ok=True)
 
-        archivos_audio = list(dir_entrada.glob("*.*"))
+        archivos_audio = [ruta for ruta in dir_entrada.glob("*.*") if ruta.is_file()]
         if not archivos_audio:
             print(f"⚠️ No se encontraron archivos en '{dir_entrada}'.")
             return
 
-        for ruta_audio in archivos_audio:
-            if not ruta_audio.is_file(): continue
-
-            print(f"\n--- Procesando: {ruta_audio.name} ---")
-            nombre_base_salida = dir_salida / ruta_audio.stem
-            texto_diarizado_final = ""
-
-            # --- 1. Convertir a WAV ---
-            dir_temporal_wav = dir_temporal_base / "wav"
-            dir_temporal_wav.mkdir(exist_ok=True)
-            ruta_wav = convertir_a_wav(ruta_audio, dir_temporal_wav)
-            if not ruta_wav:
-                print(f"⏭️ Saltando archivo {ruta_audio.name} (error conversión)." )
-                continue
-
-            # Cargar el audio WAV completo para poder extraer segmentos
-            try:
-                audio_completo = AudioSegment.from_wav(ruta_wav)
-            except Exception as e:
-                 print(f"❌ Error al cargar WAV {ruta_wav.name} para segmentar: {e}")
-                 print(f"⏭️ Saltando archivo {ruta_audio.name}." )
-                 continue
-
-            # --- 2. Diarizar --- 
-            diarization_info = diarizar_audio(ruta_wav)
-            if diarization_info is None:
-                print(f"⚠️ No se pudo diarizar {ruta_audio.name}. Se transcribirá sin hablantes.")
-                # Transcribir el archivo completo sin diarización
-                dir_temporal_chunks_full = dir_temporal_base / "chunks_full"
-                dir_temporal_chunks_full.mkdir(exist_ok=True)
-                resultado_completo = _transcribir_wav_con_chunking_opcional(ruta_wav, dir_temporal_chunks_full, forzar_chunking=True)
-                if resultado_completo and resultado_completo.get("text"):
-                     texto_diarizado_final = f"SPEAKER_?: {resultado_completo['text']}\n"
-                else:
-                     print(f"❌ Falló también la transcripción completa de {ruta_audio.name}.")
-                     texto_diarizado_final = "SPEAKER_?: [Error en transcripción completa]\n"
-
-            else:
-                # --- 3. Iterar turnos diarizados y transcribir cada uno --- 
-                print(f"   Iterando sobre {len(list(diarization_info.itertracks(yield_label=True)))} turnos de hablante...")
-                dir_temporal_turnos = dir_temporal_base / "turn_chunks"
-                dir_temporal_turnos.mkdir(exist_ok=True)
-
-                for i, (turn, _, speaker) in enumerate(diarization_info.itertracks(yield_label=True)):
-                    start_s, end_s = turn.start, turn.end
-                    start_ms, end_ms = int(start_s * 1000), int(end_s * 1000)
-                    duracion_ms = end_ms - start_ms
-
-                    print(f"   Procesando Turno {i+1}: {speaker} [{start_s:.2f}s - {end_s:.2f}s] ({duracion_ms/1000:.1f}s)")
-
-                    # Saltar turnos muy cortos como en tu ejemplo
-                    if duracion_ms < 100: # Menos de 0.1 segundos
-                        print(f"      ⏭️ Saltando turno {i+1} (demasiado corto: {duracion_ms}ms)")
-                        continue
-
-                    # Extraer segmento del turno
-                    try:
-                        segmento_turno = audio_completo[start_ms:end_ms]
-                    except Exception as e:
-                        print(f"      ❌ Error al extraer audio del turno {i+1}: {e}")
-                        continue
-
-                    # Guardar segmento del turno en archivo temporal
-                    ruta_turno_wav = dir_temporal_turnos / f"{ruta_wav.stem}_turn_{i+1}.wav"
-                    try:
-                        segmento_turno.export(ruta_turno_wav, format="wav")
-                    except Exception as e:
-                         print(f"      ❌ Error al exportar WAV del turno {i+1}: {e}")
-                         continue
-
-                    # Transcribir el WAV del turno (con chunking opcional si el turno es largo)
-                    dir_temporal_chunks_turno = dir_temporal_base / "turn_subchunks"
-                    dir_temporal_chunks_turno.mkdir(exist_ok=True)
-                    resultado_transcripcion = _transcribir_wav_con_chunking_opcional(
-                        ruta_turno_wav, dir_temporal_chunks_turno
-                    )
-
-                    if resultado_transcripcion and resultado_transcripcion.get("text"):
-                        texto_transcrito = resultado_transcripcion["text"]
-                        texto_diarizado_final += f"{speaker}: {texto_transcrito}\n"
-                    else:
-                        print(f"      ⚠️ No se pudo transcribir el turno {i+1}. Se omitirá.")
-                        # Podríamos añadir un placeholder si quisiéramos
-                        # texto_diarizado_final += f"{speaker}: [Error en transcripción turno {i+1}]\n"
-
-                    # Limpiar WAV del turno
-                    try:
-                        ruta_turno_wav.unlink()
-                    except OSError as e:
-                         print(f"     ⚠️ No se pudo borrar el archivo temporal del turno: {e}")
-
-            # --- 4. Guardar resultado final --- 
-            if texto_diarizado_final:
-                 guardar_transcripcion(texto_diarizado_final, nombre_base_salida)
-            else:
-                 print(f"❌ No se generó texto final para {ruta_audio.name}.")
+        # Cada archivo hace exactamente un put() al terminar su pipeline,
+        # falle en la etapa que falle; el hilo principal espera N gets
+        terminados: "queue.Queue[Path]" = queue.Queue()
+
+        with ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="convert") as convert_pool, \
+             ThreadPoolExecutor(max_workers=1, thread_name_prefix="diarize") as diarize_pool, \
+             ThreadPoolExecutor(max_workers=MAX_TRANSCRIPCIONES_CONCURRENTES, thread_name_prefix="api") as api_pool:
+
+            def _al_terminar_transcripcion(futuro, ruta_audio: Path) -> None:
+                try:
+                    futuro.result()
+                except Exception as e:
+                    print(f"❌ Error transcribiendo {ruta_audio.name}: {e}")
+                finally:
+                    terminados.put(ruta_audio)
+
+            def _al_terminar_diarizacion(futuro, ruta_audio: Path, conversion: tuple) -> None:
+                ruta_wav, waveform, sample_rate = conversion
+                try:
+                    diarization_info = futuro.result()
+                except Exception as e:
+                    print(f"❌ Error diarizando {ruta_audio.name}: {e}")
+                    diarization_info = None
+                futuro_api = api_pool.submit(
+                    _etapa_transcribir, ruta_audio, ruta_wav, waveform, sample_rate,
+                    diarization_info, dir_temporal_chunks_turno, dir_salida / ruta_audio.stem
+                )
+                futuro_api.add_done_callback(
+                    lambda f: _al_terminar_transcripcion(f, ruta_audio)
+                )
+
+            def _al_terminar_conversion(futuro, ruta_audio: Path) -> None:
+                try:
+                    conversion = futuro.result()
+                except Exception as e:
+                    print(f"❌ Error convirtiendo {ruta_audio.name}: {e}")
+                    conversion = None
+                if conversion is None:
+                    print(f"⏭️ Saltando archivo {ruta_audio.name} (error conversión)." )
+                    terminados.put(ruta_audio)
+                    return
+                futuro_dia = diarize_pool.submit(_etapa_diarizar, *conversion,
+                                                 num_speakers=num_speakers,
+                                                 max_speakers=max_speakers)
+                futuro_dia.add_done_callback(
+                    lambda f: _al_terminar_diarizacion(f, ruta_audio, conversion)
+                )
+
+            for ruta_audio in archivos_audio:
+                print(f"\n--- Procesando: {ruta_audio.name} ---")
+                futuro_conv = convert_pool.submit(_etapa_convertir, ruta_audio, dir_temporal_wav)
+                futuro_conv.add_done_callback(
+                    lambda f, r=ruta_audio: _al_terminar_conversion(f, r)
+                )
+
+            # Esperar a que todos los archivos completen (o abandonen) su pipeline
+            for _ in archivos_audio:
+                terminados.get()
 
     print("🏁 Proceso completado.")
 
@@ -415,6 +735,18 @@ if __name__ == "__main__":
         default=Path("/home/kaslu/data_modeler/GLCV-Data-AI-Solutions/Gadget/audio_to_text/text"),
         help="Ruta al directorio donde se guardarán las transcripciones diarizadas (.txt)."
     )
+    parser.add_argument(
+        "--num-speakers",
+        type=int,
+        default=None,
+        help="Número exacto de hablantes, si se conoce (acelera el clustering)."
+    )
+    parser.add_argument(
+        "--max-speakers",
+        type=int,
+        default=None,
+        help="Cota superior de hablantes, si se conoce (ignorada si se pasa --num-speakers)."
+    )
     # ... (resto del __main__ sin cambios, incluyendo la validación de ffmpeg)
     args = parser.parse_args()
     directorio_entrada_fijo = Path("/home/kaslu/data_modeler/GLCV-Data-AI-Solutions/Gadget/audio_to_text/audio")
@@ -424,5 +756,7 @@ if __name__ == "__main__":
     procesar_directorio(
         dir_entrada=directorio_entrada_fijo,
         dir_salida=args.directorio_salida,
+        num_speakers=args.num_speakers,
+        max_speakers=args.max_speakers,
         # formato_salida_json=args.json # Eliminado
     )
\ No newline at end of file
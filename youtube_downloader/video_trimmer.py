@@ -8,6 +8,10 @@ utilizando la biblioteca moviepy.
 """
 
 import os
+import re
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List, Tuple
 import typer
 from rich.console import Console
@@ -16,23 +20,25 @@ from moviepy.editor import VideoFileClip, AudioFileClip, concatenate_videoclips,
 console = Console()
 app = typer.Typer(help="Herramienta para recortar videos y audio")
 
+# Compilado una vez: grupos (horas, minutos, segundos), los dos primeros opcionales
+_TIEMPO_RE = re.compile(r'^(?:(?:(\d+):)?(\d+):)?(\d+(?:\.\d+)?)$')
+
 def parsear_tiempo(tiempo_str: str) -> float:
     """Convierte un string de tiempo HH:MM:SS.ms o MM:SS.ms o SS.ms a segundos."""
-    partes = tiempo_str.split(':')
-    segundos = 0.0
-    multiplicador = 1
-    for parte in reversed(partes):
-        try:
-            segundos += float(parte) * multiplicador
-            multiplicador *= 60
-        except ValueError:
-            raise typer.BadParameter(f"Formato de tiempo inválido: '{tiempo_str}'. Use HH:MM:SS.ms, MM:SS.ms o SS.ms.")
-    return segundos
+    m = _TIEMPO_RE.match(tiempo_str.strip())
+    if not m:
+        raise typer.BadParameter(f"Formato de tiempo inválido: '{tiempo_str}'. Use HH:MM:SS.ms, MM:SS.ms o SS.ms.")
+    horas, minutos, segundos = m.groups()
+    return int(horas or 0) * 3600 + int(minutos or 0) * 60 + float(segundos)
 
 def parsear_rangos(rangos_str: List[str]) -> List[Tuple[float, float]]:
-    """Convierte una lista de strings 'inicio-fin' en tuplas de segundos."""
+    """Convierte una lista de strings 'inicio-fin' en tuplas de segundos.
+
+    Cada elemento puede contener varios rangos separados por comas, útil
+    cuando los cortes vienen generados en un solo argumento.
+    """
     rangos_segundos = []
-    for rango in rangos_str:
+    for rango in (r.strip() for elemento in rangos_str for r in elemento.split(',') if r.strip()):
         try:
             inicio_str, fin_str = rango.split('-')
             inicio = parsear_tiempo(inicio_str.strip())
@@ -44,8 +50,48 @@ def parsear_rangos(rangos_str: List[str]) -> List[Tuple[float, float]]:
             raise typer.BadParameter(f"Formato de rango inválido: '{rango}'. Use 'inicio-fin'. Ejemplo: '00:10-00:25.5'.")
         except Exception as e:
              raise typer.BadParameter(f"Error procesando el rango '{rango}': {e}")
+    if not rangos_segundos:
+        raise typer.BadParameter("No se encontró ningún rango válido. Use 'inicio-fin'. Ejemplo: '00:10-00:25.5'.")
     return rangos_segundos
 
+def _cortar_rango_ffmpeg(archivo_entrada: str, inicio: float, fin: float, ruta_salida: str) -> bool:
+    """Corta [inicio, fin] copiando los streams, sin re-encodificar.
+
+    La copia directa es 20-100x más rápida que re-encodificar con moviepy y
+    no pierde calidad; a cambio el corte cae en el keyframe más cercano.
+    """
+    comando = [
+        "ffmpeg", "-y", "-loglevel", "error",
+        "-ss", str(inicio), "-to", str(fin), "-i", archivo_entrada,
+        "-c", "copy", "-avoid_negative_ts", "make_zero",
+        ruta_salida,
+    ]
+    resultado = subprocess.run(comando, capture_output=True, text=True)
+    if resultado.returncode != 0:
+        console.print(f"[bold red]Error de ffmpeg cortando [{inicio:.2f}s - {fin:.2f}s]:[/bold red] {resultado.stderr.strip()}")
+        return False
+    return True
+
+def _unir_clips_ffmpeg(rutas_clips: List[str], ruta_salida: str) -> bool:
+    """Concatena clips ya cortados con el demuxer concat de ffmpeg (-c copy)."""
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as lista:
+        for ruta in rutas_clips:
+            lista.write(f"file '{os.path.abspath(ruta)}'\n")
+        ruta_lista = lista.name
+    try:
+        comando = [
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "concat", "-safe", "0", "-i", ruta_lista,
+            "-c", "copy", ruta_salida,
+        ]
+        resultado = subprocess.run(comando, capture_output=True, text=True)
+        if resultado.returncode != 0:
+            console.print(f"[bold red]Error de ffmpeg uniendo clips:[/bold red] {resultado.stderr.strip()}")
+            return False
+        return True
+    finally:
+        os.remove(ruta_lista)
+
 @app.command()
 def recortar(
     archivo_entrada: str = typer.Argument(..., help="Ruta al archivo de video o audio a recortar.", exists=True, file_okay=True, dir_okay=False, readable=True),
@@ -57,7 +103,8 @@ def recortar(
         help="Directorio donde guardar los archivos recortados.", 
         file_okay=False, dir_okay=True, writable=True
     ),
-    unir_clips: bool = typer.Option(False, "--unir", "-u", help="Unir todos los clips recortados en un solo archivo de salida.")
+    unir_clips: bool = typer.Option(False, "--unir", "-u", help="Unir todos los clips recortados en un solo archivo de salida."),
+    reencode: bool = typer.Option(False, "--reencode", help="Re-encodificar los clips (corte exacto a frame) en vez de copiar streams con ffmpeg.")
 ):
     """Recorta segmentos de un archivo de video o audio según los rangos especificados."""
     
@@ -83,7 +130,59 @@ def recortar(
     if not es_video and not es_audio:
         console.print(f"[bold red]Error:[/bold red] Formato de archivo no soportado: {ext_entrada}")
         raise typer.Exit(code=1)
-        
+
+    if not reencode:
+        # Camino rápido: copia de streams con ffmpeg. Los cortes caen en el
+        # keyframe más cercano; para cortes exactos a frame usar --reencode.
+        console.print("[bold]Modo copia de streams (use --reencode para cortes exactos a frame).[/bold]")
+        try:
+            with console.status("[bold yellow]Cortando con ffmpeg (copia de streams)...", spinner="dots") as status:
+                # Cada corte es un proceso ffmpeg independiente y limitado por
+                # IO: lanzarlos concurrentes en vez de uno a uno
+                with ThreadPoolExecutor(max_workers=min(len(rangos_parseados), os.cpu_count() or 1)) as pool:
+                    futuros = {}
+                    for i, (inicio, fin) in enumerate(rangos_parseados):
+                        # Mantener la extensión de entrada: la copia no cambia el códec
+                        nombre_clip = f"{archivo_salida}_clip_{i+1}{ext_entrada}"
+                        ruta_clip = os.path.join(directorio_salida, nombre_clip)
+                        futuro = pool.submit(_cortar_rango_ffmpeg, archivo_entrada, inicio, fin, ruta_clip)
+                        futuros[futuro] = (i, ruta_clip)
+
+                    clips_exitosos = []
+                    for completados, futuro in enumerate(as_completed(futuros), start=1):
+                        status.update(f"[bold yellow]Cortados {completados}/{len(futuros)} clips...")
+                        i, ruta_clip = futuros[futuro]
+                        if futuro.result():
+                            clips_exitosos.append((i, ruta_clip))
+                            if not unir_clips:
+                                console.print(f"[green]✓ Clip guardado:[/green] {ruta_clip}")
+
+                # Recuperar el orden original de los rangos para la unión
+                rutas_clips = [ruta for _, ruta in sorted(clips_exitosos)]
+
+                if unir_clips and rutas_clips:
+                    ruta_final = os.path.join(directorio_salida, f"{archivo_salida}_unido{ext_entrada}")
+                    status.update(f"[bold yellow]Uniendo {len(rutas_clips)} clips...")
+                    if not _unir_clips_ffmpeg(rutas_clips, ruta_final):
+                        # Conservar los clips individuales: son el único
+                        # resultado que le queda al usuario si la unión falla
+                        console.print(f"[bold red]Falló la unión; se conservan los clips individuales en {directorio_salida}.[/bold red]")
+                        raise typer.Exit(code=1)
+                    console.print(f"[green]✓ Archivo unido guardado:[/green] {ruta_final}")
+                    # Los clips individuales eran intermedios en este modo
+                    for ruta_clip in rutas_clips:
+                        os.remove(ruta_clip)
+        except FileNotFoundError:
+            console.print("[bold red]Error:[/bold red] ffmpeg no encontrado. Instálelo o use --reencode.")
+            raise typer.Exit(code=1)
+
+        if not rutas_clips:
+            console.print("[bold red]No se pudo cortar ningún clip.[/bold red]")
+            raise typer.Exit(code=1)
+
+        console.print("[bold green]¡Proceso de recorte completado con éxito![/bold green]")
+        return
+
     clips_recortados = []
     
     try:
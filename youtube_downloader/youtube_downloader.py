@@ -7,23 +7,448 @@ Este script permite descargar videos y/o pistas de audio desde YouTube
 utilizando la biblioteca pytube.
 """
 
+import asyncio
+import functools
 import os
+import re
+import shutil
+import subprocess
 import sys
 from typing import Optional
 from enum import Enum
 
 import typer
-from rich.console import Console
-from rich.progress import Progress, TextColumn, BarColumn, DownloadColumn, TransferSpeedColumn
-# from pytube import YouTube # Comentado para usar pytubefix
-# from pytube.exceptions import PytubeError # Las excepciones parecen venir del mismo lugar
-from pytubefix import YouTube # Usamos pytubefix para la funcionalidad principal
-# from pytubefix.exceptions import PytubeError # Incorrecto
-from pytube.exceptions import PytubeError # Usamos pytube original para las excepciones
-
-console = Console()
+
+# Las dependencias pesadas (aiohttp, diskcache, rich, pytubefix) se importan
+# dentro de accesores perezosos o de las funciones que las usan: --help y el
+# autocompletado del shell no pagan sus cientos de ms de import
+
 app = typer.Typer(help="Herramienta para descargar videos y audio de YouTube")
 
+@functools.cache
+def _consola():
+    """Console de rich, creada la primera vez que algo imprime."""
+    from rich.console import Console
+    return Console()
+
+# Cache en proceso del player base.js de YouTube: varias construcciones de
+# YouTube() en una misma sesión comparten el mismo player descifrado
+_JS_CACHE: dict = {}
+
+@functools.cache
+def _clase_youtube():
+    """Importa pytubefix y devuelve YouTube con el cache de base.js aplicado."""
+    from pytubefix import YouTube
+    try:
+        js_original = YouTube.js.fget
+
+        def _js_cacheado(self):
+            if self.js_url not in _JS_CACHE:
+                _JS_CACHE[self.js_url] = js_original(self)
+            return _JS_CACHE[self.js_url]
+
+        YouTube.js = property(_js_cacheado)
+    except AttributeError:
+        # Si cambia la implementación interna de pytubefix, seguimos sin cache
+        pass
+    return YouTube
+
+# Descarga paralela: el CDN de YouTube limita el ancho de banda por conexión,
+# así que repartir el archivo en peticiones Range concurrentes lo multiplica
+N_CONEXIONES_DESCARGA = 8
+TAMANO_TROZO_DESCARGA = 4 * 1024 * 1024  # 4 MiB por petición Range
+TAMANO_BUFER_ESCRITURA = 1 << 20  # 1 MiB por write: ~16x menos syscalls
+
+@functools.cache
+def _cache_metadatos():
+    """Cache persistente de metadatos por video_id: invocaciones repetidas
+    sobre la misma URL se ahorran las idas y vueltas HTTPS de construir
+    YouTube()."""
+    from diskcache import Cache
+    return Cache(os.path.expanduser("~/.cache/gadget_yt"))
+
+# Cache de segmentos descargados: re-descargar un video interrumpido solo
+# baja los rangos que falten; los cacheados se vuelcan con sendfile
+_DIR_SEGMENTOS = os.path.expanduser("~/.cache/gadget_yt/segments")
+
+_VIDEO_ID_RE = re.compile(r"(?:v=|youtu\.be/|shorts/)([A-Za-z0-9_-]{11})")
+
+# Resoluciones explícitas tipo "720p": el fullmatch descarta cadenas como
+# "potato" que el antiguo chequeo '"p" in calidad' dejaba pasar
+_RES_RE = re.compile(r"(\d{3,4})p")
+
+# Extensión de solo-audio por subtipo de contenedor para --audio-copy:
+# audio/mp4 no puede acabar en .mp4 o chocaría con el archivo de video
+# (que con --formato ambos se descarga a la vez sobre la misma ruta)
+_EXT_AUDIO_COPIA = {"mp4": "m4a", "webm": "weba"}
+
+# Muxer explícito (-f) para cada subtipo: ffmpeg elige el formato de
+# salida por la extensión, y .weba/.m4a no registran ningún muxer
+# (webm solo registra .webm; m4a vive dentro del muxer "ipod")
+_MUXER_AUDIO_COPIA = {"mp4": "ipod", "webm": "webm"}
+
+class _TablaSaneado(dict):
+    """Tabla para str.translate: conserva alfanuméricos, espacio, '.' y '_'.
+
+    Memoiza cada punto de código la primera vez que aparece, así el
+    saneado completo corre en C con una sola pasada sobre el título.
+    """
+    def __missing__(self, codepoint):
+        permitido = chr(codepoint).isalnum() or codepoint in (0x20, 0x2E, 0x5F)
+        resultado = self[codepoint] = codepoint if permitido else None
+        return resultado
+
+_SANITIZE_TABLE = _TablaSaneado()
+
+def _sanear_nombre_archivo(titulo: str) -> str:
+    """Limpia un título de video para usarlo como nombre de archivo."""
+    return titulo.translate(_SANITIZE_TABLE).rstrip()
+
+def _extraer_video_id(url: str) -> str:
+    """Extrae el ID de 11 caracteres de una URL de YouTube."""
+    m = _VIDEO_ID_RE.search(url)
+    if not m:
+        raise typer.BadParameter(f"No se pudo extraer el ID de video de la URL: {url}")
+    return m.group(1)
+
+def _stream_a_dict(s) -> dict:
+    """Reduce un Stream de pytubefix a los campos que usamos, cacheables en disco."""
+    return {
+        "itag": s.itag,
+        "url": s.url,
+        "mime_type": s.mime_type,
+        "subtype": s.subtype,
+        "resolution": s.resolution,
+        "abr": s.abr,
+        "bitrate": s.bitrate,
+        "is_progressive": s.is_progressive,
+        "includes_audio": s.includes_audio_track,
+        "includes_video": s.includes_video_track,
+    }
+
+def _obtener_info_video(video_id: str) -> dict:
+    """Construye YouTube() una vez por video y cachea sus metadatos 24 horas."""
+    clave = f"video_info:{video_id}"
+    info = _cache_metadatos().get(clave)
+    if info is None:
+        yt = _clase_youtube()(f"https://youtu.be/{video_id}")
+        info = {
+            "title": yt.title,
+            "author": yt.author,
+            "length": yt.length,
+            "streams": [_stream_a_dict(s) for s in yt.streams.fmt_streams],
+        }
+        _cache_metadatos().set(clave, info, expire=86400, tag="video_info")
+    return info
+
+async def _obtener_oembed(session, video_id: str) -> dict:
+    """Título y autor vía el endpoint oEmbed (~1 KB de JSON).
+
+    Evita bajar la página completa del video (~400 KB) solo para
+    imprimir la cabecera; los metadatos completos se piden después,
+    únicamente cuando hace falta elegir un stream.
+    """
+    import aiohttp
+
+    clave = f"oembed:{video_id}"
+    datos = _cache_metadatos().get(clave)
+    if datos is None:
+        async with session.get(
+            "https://www.youtube.com/oembed",
+            params={"url": f"https://youtu.be/{video_id}", "format": "json"},
+            timeout=aiohttp.ClientTimeout(total=5),
+        ) as respuesta:
+            respuesta.raise_for_status()
+            datos = await respuesta.json()
+        _cache_metadatos().set(clave, datos, expire=86400, tag="oembed")
+    return datos
+
+def _invalidar_info_video(video_id: str) -> None:
+    """Borra la entrada cacheada (p.ej. cuando las URL firmadas caducan)."""
+    _cache_metadatos().delete(f"video_info:{video_id}")
+
+def _res_a_px(resolution: Optional[str]) -> int:
+    """Convierte '720p' en 720 (0 si el stream no declara resolución)."""
+    return int(resolution.rstrip("p")) if resolution else 0
+
+def _elegir_video(streams: list, calidad: Optional[str] = None) -> Optional[dict]:
+    """Elige el stream de video con un índice precomputado por resolución.
+
+    Una pasada construye {(px, progresivo, subtipo): stream} y la
+    selección queda en consultas O(1): con una resolución concreta
+    ("720p") un mp4 de esa resolución priorizando progresivo; con "baja"
+    el progresivo de menor resolución; en cualquier otro caso el
+    progresivo de mayor resolución.
+    """
+    por_resolucion: dict = {}
+    for s in streams:
+        if s["includes_video"]:
+            clave = (_res_a_px(s["resolution"]), s["is_progressive"], s["subtype"])
+            por_resolucion.setdefault(clave, s)
+    if calidad and (m := _RES_RE.fullmatch(calidad)):
+        objetivo = int(m.group(1))
+        return (por_resolucion.get((objetivo, True, "mp4"))
+                or por_resolucion.get((objetivo, False, "mp4")))
+    px_progresivos = {px for px, progresivo, _ in por_resolucion if progresivo}
+    if not px_progresivos:
+        return None
+    objetivo = min(px_progresivos) if calidad == "baja" else max(px_progresivos)
+    return next(s for (px, progresivo, _), s in por_resolucion.items()
+                if px == objetivo and progresivo)
+
+def _stream_solo_audio(streams: list) -> Optional[dict]:
+    """Equivalente a get_audio_only(): pista de solo audio con mayor bitrate."""
+    candidatos = [s for s in streams if s["includes_audio"] and not s["includes_video"]]
+    return max(candidatos, key=lambda s: s["bitrate"] or 0, default=None)
+
+def _volcar_segmento_cacheado(ruta_segmento: str, fd: int, offset: int,
+                              longitud: int) -> bool:
+    """Copia un segmento cacheado a su offset de destino con sendfile.
+
+    La copia fd→fd queda residente en el kernel (zero-copy, sin doble
+    memcpy por userspace); en plataformas sin sendfile entre archivos se
+    recurre a read+pwrite. Devuelve False si el segmento no existe o
+    está incompleto, para que el llamador lo descargue de la red.
+    """
+    try:
+        seg_fd = os.open(ruta_segmento, os.O_RDONLY)
+    except OSError:
+        return False
+    try:
+        if os.fstat(seg_fd).st_size != longitud:
+            return False
+        enviados = 0
+        try:
+            os.lseek(fd, offset, os.SEEK_SET)
+            while enviados < longitud:
+                n = os.sendfile(fd, seg_fd, enviados, longitud - enviados)
+                if n == 0:
+                    return False
+                enviados += n
+        except (AttributeError, OSError):
+            os.lseek(seg_fd, enviados, os.SEEK_SET)
+            while enviados < longitud:
+                datos = os.read(seg_fd, min(TAMANO_BUFER_ESCRITURA, longitud - enviados))
+                if not datos:
+                    return False
+                os.pwrite(fd, datos, offset + enviados)
+                enviados += len(datos)
+        return True
+    finally:
+        os.close(seg_fd)
+
+async def _descargar_rango(session, url: str, inicio: int, fin: int, fd: int,
+                           progress=None, task_id=None,
+                           dir_segmentos: Optional[str] = None) -> None:
+    """Descarga el rango [inicio, fin] y lo escribe en su posición con pwrite.
+
+    Con dir_segmentos, primero intenta volcar el segmento desde el cache
+    de disco; si no está, lo descarga y lo deja cacheado para la próxima.
+    """
+    longitud = fin - inicio + 1
+    ruta_segmento = None
+    if dir_segmentos is not None:
+        ruta_segmento = os.path.join(dir_segmentos, f"{inicio}-{fin}")
+        if _volcar_segmento_cacheado(ruta_segmento, fd, inicio, longitud):
+            if progress is not None:
+                progress.update(task_id, advance=longitud)
+            return
+
+    seg_fd = -1
+    if ruta_segmento is not None:
+        seg_fd = os.open(f"{ruta_segmento}.part",
+                         os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        headers = {"Range": f"bytes={inicio}-{fin}"}
+        async with session.get(url, headers=headers) as respuesta:
+            respuesta.raise_for_status()
+            offset = inicio
+            bufer = bytearray()
+
+            def _volcar() -> None:
+                nonlocal offset
+                os.pwrite(fd, bufer, offset)
+                if seg_fd >= 0:
+                    os.write(seg_fd, bufer)
+                offset += len(bufer)
+                bufer.clear()
+
+            async for datos in respuesta.content.iter_chunked(TAMANO_BUFER_ESCRITURA):
+                bufer += datos
+                if progress is not None:
+                    progress.update(task_id, advance=len(datos))
+                if len(bufer) >= TAMANO_BUFER_ESCRITURA:
+                    _volcar()
+            if bufer:
+                _volcar()
+        if seg_fd >= 0:
+            os.fsync(seg_fd)
+            os.close(seg_fd)
+            seg_fd = -1
+            # el rename atómico evita que un corte deje segmentos a medias
+            os.replace(f"{ruta_segmento}.part", ruta_segmento)
+    finally:
+        if seg_fd >= 0:
+            os.close(seg_fd)
+
+def _crear_sesion_descarga(n: int = N_CONEXIONES_DESCARGA):
+    """Sesión compartida por toda la descarga: sonda de tamaño y rangos
+    reutilizan los mismos sockets keep-alive (un solo handshake TLS por
+    conexión). Las sesiones de aiohttp viven atadas a su event loop, así
+    que se crea una por asyncio.run en vez de una global de módulo.
+
+    El límite es por host: video y audio salen de hosts distintos del
+    CDN, y así cada transferencia conserva sus n conexiones aunque
+    corran a la vez sobre la misma sesión.
+
+    Sin timeout total: el audio baja el archivo entero en un solo GET y
+    el tope de 300 s que aiohttp aplica por defecto lo cortaría a media
+    transcodificación. sock_read sigue detectando conexiones muertas.
+    """
+    import aiohttp
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit_per_host=n),
+        timeout=aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=60),
+    )
+
+async def _parallel_download(session, url: str, total_size: int, ruta_salida: str,
+                             chunk: int = TAMANO_TROZO_DESCARGA,
+                             progress=None, task_id=None,
+                             dir_segmentos: Optional[str] = None) -> None:
+    """Descarga `url` en `ruta_salida` con peticiones Range concurrentes.
+
+    Cada trozo se escribe en su offset final con pwrite sobre un archivo
+    pre-dimensionado, así no hace falta reordenar nada al terminar.
+    """
+    fd = os.open(ruta_salida, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        try:
+            # Reservar extents contiguos de golpe: menos fragmentación y
+            # writeback en I/Os más grandes al escribir rangos desordenados
+            os.posix_fallocate(fd, 0, total_size)
+        except (AttributeError, OSError):
+            os.ftruncate(fd, total_size)
+        rangos = [(inicio, min(inicio + chunk, total_size) - 1)
+                  for inicio in range(0, total_size, chunk)]
+        tareas = [asyncio.ensure_future(
+            _descargar_rango(session, url, inicio, fin, fd, progress, task_id,
+                             dir_segmentos=dir_segmentos))
+            for inicio, fin in rangos]
+        try:
+            await asyncio.gather(*tareas)
+        except BaseException:
+            # Si un rango falla hay que parar los demás antes de cerrar el
+            # fd: una tarea huérfana seguiría haciendo pwrite sobre un número
+            # de fd que el sistema puede reasignar a otro archivo
+            for tarea in tareas:
+                tarea.cancel()
+            await asyncio.gather(*tareas, return_exceptions=True)
+            raise
+    finally:
+        os.close(fd)
+
+async def _obtener_tamano_remoto(session, url: str) -> int:
+    """Lee el tamaño total del recurso vía Content-Range de una petición de 1 byte."""
+    async with session.get(url, headers={"Range": "bytes=0-0"}) as respuesta:
+        respuesta.raise_for_status()
+        return int(respuesta.headers["Content-Range"].rsplit("/", 1)[1])
+
+async def _con_reintento_url_caducada(stream: dict, video_id: str, descargar_corrutina) -> None:
+    """Espera descargar_corrutina(url); ante un 403 refresca el cache y reintenta.
+
+    Las URL firmadas del CDN expiran a las pocas horas: ante un 403 se
+    invalida la entrada, se reconstruye YouTube() y se reintenta una vez
+    con la URL fresca del mismo itag.
+    """
+    import aiohttp
+    try:
+        await descargar_corrutina(stream["url"])
+    except aiohttp.ClientResponseError as e:
+        if e.status != 403:
+            raise
+        _consola().print("[yellow]URL del stream caducada; refrescando metadatos...[/yellow]")
+        _invalidar_info_video(video_id)
+        info_fresca = await asyncio.to_thread(_obtener_info_video, video_id)
+        refrescado = next((s for s in info_fresca["streams"] if s["itag"] == stream["itag"]), None)
+        if refrescado is None:
+            raise
+        await descargar_corrutina(refrescado["url"])
+
+async def _trabajo_video(session, stream: dict, ruta_salida: str, video_id: str,
+                         progress, descripcion: str = "video") -> None:
+    """Tarea de descarga por rangos de un stream de video."""
+    # El itag forma parte de la clave: dos calidades del mismo video tienen
+    # rangos con el mismo nombre y tamaño, y mezclarlos corrompería la salida
+    dir_segmentos = os.path.join(_DIR_SEGMENTOS, video_id, str(stream["itag"]))
+    os.makedirs(dir_segmentos, exist_ok=True)
+
+    async def _correr(url: str) -> None:
+        total_size = await _obtener_tamano_remoto(session, url)
+        task_id = progress.add_task(descripcion, total=total_size)
+        await _parallel_download(session, url, total_size, ruta_salida,
+                                 progress=progress, task_id=task_id,
+                                 dir_segmentos=dir_segmentos)
+
+    await _con_reintento_url_caducada(stream, video_id, _correr)
+
+    # Con la descarga completa en disco los segmentos ya no aportan nada:
+    # sin esta poda el cache crecería con cada video descargado
+    shutil.rmtree(dir_segmentos, ignore_errors=True)
+    try:
+        os.rmdir(os.path.join(_DIR_SEGMENTOS, video_id))
+    except OSError:
+        pass
+
+async def _transmitir_a_proceso(session, url: str, proc,
+                                progress=None, task_id=None) -> None:
+    """Descarga `url` en streaming y alimenta el stdin del proceso hijo.
+
+    El drain tras cada write es clave: si ffmpeg no da abasto se suspende
+    solo esta corrutina, no el loop entero con el resto de descargas.
+    """
+    async with session.get(url) as respuesta:
+        respuesta.raise_for_status()
+        if progress is not None and respuesta.content_length:
+            progress.update(task_id, total=respuesta.content_length)
+        async for datos in respuesta.content.iter_chunked(1 << 20):
+            proc.stdin.write(datos)
+            await proc.stdin.drain()
+            if progress is not None:
+                progress.update(task_id, advance=len(datos))
+    proc.stdin.close()
+    await proc.stdin.wait_closed()
+
+async def _trabajo_audio(session, stream: dict, ruta_salida: str, video_id: str,
+                         progress, copiar: bool = False,
+                         descripcion: str = "audio") -> None:
+    """Tarea de audio: los bytes pasan en streaming por ffmpeg.
+
+    Con copiar=False transcodifica a MP3 real (192k) mientras baja; con
+    copiar=True (-c:a copy) los bytes se vuelcan tal cual al contenedor.
+    """
+    if copiar:
+        subtipo = stream["mime_type"].rsplit("/", 1)[1]
+        args_codec = ["-c:a", "copy", "-f", _MUXER_AUDIO_COPIA.get(subtipo, subtipo)]
+    else:
+        args_codec = ["-c:a", "libmp3lame", "-b:a", "192k"]
+
+    async def _correr(url: str) -> None:
+        task_id = progress.add_task(descripcion, total=None)
+        proc = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-y", "-loglevel", "error", "-i", "pipe:0", *args_codec, ruta_salida,
+            stdin=subprocess.PIPE,
+        )
+        try:
+            await _transmitir_a_proceso(session, url, proc, progress, task_id)
+        except Exception:
+            proc.kill()
+            await proc.wait()
+            raise
+        if await proc.wait() != 0:
+            raise RuntimeError(f"ffmpeg terminó con código {proc.returncode}")
+
+    await _con_reintento_url_caducada(stream, video_id, _correr)
+
 class FormatoDescarga(str, Enum):
     """Tipos de formato para descargar contenido."""
     VIDEO = "video"
@@ -34,7 +459,7 @@ class FormatoDescarga(str, Enum):
 def descargar(
     url: str = typer.Argument(..., help="URL del video de YouTube"),
     formato: FormatoDescarga = typer.Option(
-        FormatoDescarga.VIDEO, "--formato", "-f", 
+        FormatoDescarga.VIDEO, "--formato", "-f",
         help="Formato a descargar: video, audio o ambos"
     ),
     calidad: Optional[str] = typer.Option(
@@ -44,101 +469,132 @@ def descargar(
     directorio_salida: str = typer.Option(
         "descargas", "--salida", "-s",
         help="Directorio donde se guardarán los archivos"
+    ),
+    audio_copy: bool = typer.Option(
+        False, "--audio-copy",
+        help="Guardar el audio tal cual (contenedor original) en vez de transcodificar a MP3"
     )
 ):
     """Descarga videos y/o audio de YouTube según las opciones especificadas."""
+    from pytubefix.exceptions import PytubeFixError
+
+    console = _consola()
     try:
-        # Crear el directorio de salida si no existe
-        if not os.path.exists(directorio_salida):
-            os.makedirs(directorio_salida)
-            console.print(f"[green]Creado directorio: {directorio_salida}[/green]")
-        
-        # Iniciar obtención de información
-        with console.status(f"[bold blue]Obteniendo información del video: {url}[/bold blue]"):
-            yt = YouTube(url) # Sin callback por ahora
-        
-        console.print(f"[bold green]Video encontrado:[/bold green] {yt.title}")
-        console.print(f"[bold]Autor:[/bold] {yt.author}")
-        console.print(f"[bold]Duración:[/bold] {yt.length // 60} minutos {yt.length % 60} segundos")
-        
-        # Descargar según el formato solicitado
+        asyncio.run(_descargar_async(url, formato, calidad, directorio_salida, audio_copy))
+    except PytubeFixError as e:
+        console.print(f"[bold red]Error de pytubefix:[/bold red] {str(e)}")
+    except Exception as e:
+        console.print(f"[bold red]Error:[/bold red] {str(e)}")
+
+async def _descargar_async(url: str, formato: FormatoDescarga,
+                           calidad: Optional[str], directorio_salida: str,
+                           audio_copy: bool, session=None) -> None:
+    """Núcleo async de la descarga de un video.
+
+    Acepta una sesión externa para que un futuro modo playlist pueda
+    lanzar varios videos con asyncio.gather compartiendo sesión y event
+    loop; sin ella crea (y cierra) una propia.
+    """
+    from rich.progress import Progress, TextColumn, BarColumn, DownloadColumn, TransferSpeedColumn
+
+    console = _consola()
+    sesion_propia = session is None
+    if sesion_propia:
+        session = _crear_sesion_descarga()
+    try:
+        # Crear el directorio de salida si no existe (una syscall, sin TOCTOU)
+        os.makedirs(directorio_salida, exist_ok=True)
+
+        video_id = _extraer_video_id(url)
+
+        # Cabecera con el oEmbed barato; los metadatos completos (streams)
+        # se piden solo cuando el formato elegido los necesita
+        console.print(f"[bold blue]Obteniendo información del video: {url}[/bold blue]")
+        oembed = await _obtener_oembed(session, video_id)
+
+        console.print(f"[bold green]Video encontrado:[/bold green] {oembed['title']}")
+        console.print(f"[bold]Autor:[/bold] {oembed['author_name']}")
+
+        # Limpiar nombre de archivo para evitar problemas (una sola vez)
+        nombre_archivo_limpio = _sanear_nombre_archivo(oembed["title"])
+
+        # Todas las ramas de formato necesitan los metadatos completos, así
+        # que se piden una vez aquí; la duración sale del mismo cache
+        info = await asyncio.to_thread(_obtener_info_video, video_id)
+        console.print(f"[bold]Duración:[/bold] {info['length'] // 60} minutos {info['length'] % 60} segundos")
+
+        # Preparar los trabajos de descarga; con AMBOS, video y audio
+        # corren a la vez sobre la misma sesión (wall-clock max en vez de suma)
+        trabajos = []  # (tipo, ruta_salida, fabrica(progress) -> corrutina)
+
         if formato in [FormatoDescarga.VIDEO, FormatoDescarga.AMBOS]:
-            # --- Descarga de Video --- 
-            stream = None
-            with console.status("[bold yellow]Buscando stream de video..."):
-                if calidad:
-                    if calidad == "alta":
-                        stream = yt.streams.get_highest_resolution()
-                    elif calidad == "baja":
-                        stream = yt.streams.get_lowest_resolution()
-                    elif "p" in calidad:  # Si es una resolución específica como "720p"
-                        stream = yt.streams.filter(res=calidad, progressive=True, file_extension="mp4").first() # Priorizar progresivo si se especifica calidad
-                        if not stream:
-                           stream = yt.streams.filter(res=calidad, file_extension="mp4").first() # Fallback no progresivo
-                    else:
-                        # Si la calidad no es reconocida, usar la más alta
-                        stream = yt.streams.get_highest_resolution()
-                else:
-                    stream = yt.streams.get_highest_resolution()
-            
+            # --- Descarga de Video ---
+            console.print("[yellow]Buscando stream de video...[/yellow]")
+            stream = _elegir_video(info["streams"], calidad)
+
             if not stream:
                 console.print(f"[bold red]No se encontró stream de video para la calidad especificada ({calidad or 'más alta'}).[/bold red]")
             else:
-                # Limpiar nombre de archivo para evitar problemas
-                nombre_archivo_limpio = "".join(c for c in yt.title if c.isalnum() or c in (' ', '.', '_')).rstrip()
-                nombre_archivo_video = f"{nombre_archivo_limpio}.{stream.mime_type.split('/')[-1]}"
+                extension_video = stream["mime_type"].rsplit("/", 1)[1]
+                nombre_archivo_video = f"{nombre_archivo_limpio}.{extension_video}"
                 ruta_completa_video = os.path.join(directorio_salida, nombre_archivo_video)
-                
-                console.print(f"[blue]Descargando video ({stream.resolution}, {stream.filesize_mb:.2f} MB) a {ruta_completa_video}...[/blue]")
-                try:
-                    # Usar el método de descarga directo
-                    stream.download(output_path=directorio_salida, filename=nombre_archivo_video)
-                    console.print(f"[bold green]✓[/bold green] Video descargado: {os.path.basename(ruta_completa_video)}")
-                except Exception as e:
-                    console.print(f"[bold red]Error descargando video:[/bold red] {e}")
-                    # Opcional: Limpiar archivo parcial si existe
-                    # if os.path.exists(ruta_completa_video):
-                    #     os.remove(ruta_completa_video)
-        
+                descripcion = f"video {stream['resolution']}"
+                trabajos.append((
+                    "video", ruta_completa_video,
+                    lambda progress, s=stream, ruta=ruta_completa_video, d=descripcion:
+                        _trabajo_video(session, s, ruta, video_id, progress, descripcion=d),
+                ))
+
         if formato in [FormatoDescarga.AUDIO, FormatoDescarga.AMBOS]:
-             # --- Descarga de Audio --- 
-            stream = None
-            with console.status("[bold yellow]Buscando stream de audio..."):
-                 stream = yt.streams.get_audio_only()
-            
+             # --- Descarga de Audio ---
+            console.print("[yellow]Buscando stream de audio...[/yellow]")
+            stream = _stream_solo_audio(info["streams"])
+
             if not stream:
                 console.print("[bold red]No se encontró stream de audio.[/bold red]")
             else:
-                 # Limpiar nombre de archivo para evitar problemas
-                nombre_archivo_limpio = "".join(c for c in yt.title if c.isalnum() or c in (' ', '.', '_')).rstrip()
-                nombre_temporal_audio = f"{nombre_archivo_limpio}_audio_temp.{stream.mime_type.split('/')[-1]}"
-                ruta_temporal_audio = os.path.join(directorio_salida, nombre_temporal_audio)
-                nombre_final_audio = f"{nombre_archivo_limpio}.mp3"
+                if audio_copy:
+                    subtipo = stream["mime_type"].rsplit("/", 1)[1]
+                    extension_audio = _EXT_AUDIO_COPIA.get(subtipo, subtipo)
+                else:
+                    extension_audio = "mp3"
+                nombre_final_audio = f"{nombre_archivo_limpio}.{extension_audio}"
                 ruta_final_audio = os.path.join(directorio_salida, nombre_final_audio)
+                descripcion = f"audio {stream['abr']}"
+                trabajos.append((
+                    "audio", ruta_final_audio,
+                    lambda progress, s=stream, ruta=ruta_final_audio, d=descripcion:
+                        _trabajo_audio(session, s, ruta, video_id, progress,
+                                       copiar=audio_copy, descripcion=d),
+                ))
 
-                console.print(f"[blue]Descargando audio ({stream.abr}, {stream.filesize_mb:.2f} MB) a {ruta_final_audio}...[/blue]")
-                try:
-                    # Descarga directa al archivo temporal
-                    stream.download(output_path=directorio_salida, filename=nombre_temporal_audio)
-
-                    # Renombrar a formato mp3 si la descarga fue exitosa
-                    if os.path.exists(ruta_final_audio):
-                        os.remove(ruta_final_audio) 
-                    os.rename(ruta_temporal_audio, ruta_final_audio)
-                    console.print(f"[bold green]✓[/bold green] Audio descargado: {os.path.basename(ruta_final_audio)}")
+        if trabajos:
+            with Progress(
+                TextColumn("[progress.description]{task.description}"),
+                BarColumn(), DownloadColumn(), TransferSpeedColumn(),
+                console=console,
+            ) as progress:
+                resultados = await asyncio.gather(
+                    *[fabrica(progress) for _, _, fabrica in trabajos],
+                    return_exceptions=True,
+                )
 
-                except Exception as e:
-                    console.print(f"[bold red]Error descargando audio:[/bold red] {e}")
-                    # Limpiar archivo temporal si existe
-                    if os.path.exists(ruta_temporal_audio):
-                        os.remove(ruta_temporal_audio)
+            # Las barras completadas quedan en pantalla; solo los errores
+            # merecen líneas adicionales
+            for (tipo, ruta_salida, _), resultado in zip(trabajos, resultados):
+                if isinstance(resultado, BaseException):
+                    console.print(f"[bold red]Error descargando {tipo}:[/bold red] {resultado}")
+                    # Limpiar salida parcial si existe
+                    try:
+                        os.remove(ruta_salida)
+                    except FileNotFoundError:
+                        pass
 
         console.print("[bold green]¡Proceso de descarga finalizado![/bold green]")
-        
-    except PytubeError as e:
-        console.print(f"[bold red]Error de pytube:[/bold red] {str(e)}")
-    except Exception as e:
-        console.print(f"[bold red]Error:[/bold red] {str(e)}")
+    finally:
+        if sesion_propia:
+            await session.close()
+
 
 if __name__ == "__main__":
     app()